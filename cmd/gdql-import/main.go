@@ -4,19 +4,22 @@
 // Usage:
 //
 //	gdql-import [-db path] setlistfm          Import from setlist.fm API
-//	gdql-import [-db path] json <file>        Import from canonical JSON
+//	gdql-import [-db path] json <file>        Import from canonical JSON (.json or .json.gz)
 //	gdql-import [-db path] lyrics <file>      Import lyrics JSON
 //	gdql-import [-db path] aliases <file>     Import song alias mappings
 //	gdql-import [-db path] fix-sets           Re-infer set numbers from song order
 package main
 
 import (
+	"compress/gzip"
 	"context"
 	"database/sql"
 	"encoding/json"
 	"fmt"
+	"io"
 	"os"
 	"strconv"
+	"strings"
 	"github.com/gdql/gdql/internal/data/sqlite"
 	"github.com/gdql/gdql/internal/import/canonical"
 	"github.com/gdql/gdql/internal/import/deadlists"
@@ -78,7 +81,7 @@ func main() {
 			fatal(err)
 		}
 		defer db.Close()
-		data, err := os.ReadFile(path)
+		data, err := readMaybeGzip(path)
 		if err != nil {
 			fatal(err)
 		}
@@ -447,6 +450,24 @@ func argOrFlag(args []string) string {
 	return args[0]
 }
 
+// readMaybeGzip reads path, transparently decompressing it if it ends in .gz.
+func readMaybeGzip(path string) ([]byte, error) {
+	if !strings.HasSuffix(path, ".gz") {
+		return os.ReadFile(path)
+	}
+	f, err := os.Open(path)
+	if err != nil {
+		return nil, err
+	}
+	defer f.Close()
+	zr, err := gzip.NewReader(f)
+	if err != nil {
+		return nil, fmt.Errorf("%s: %w", path, err)
+	}
+	defer zr.Close()
+	return io.ReadAll(zr)
+}
+
 func fatal(err error) {
 	fmt.Fprintf(os.Stderr, "Error: %v\n", err)
 	os.Exit(1)
@@ -459,7 +480,7 @@ func printUsage() {
 	fmt.Fprintln(w, "Commands:")
 	fmt.Fprintln(w, "  deadlists [first] [last]   Crawl setlists.net for proper set data (default: 1965-1995)")
 	fmt.Fprintln(w, "  setlistfm                  Import shows from setlist.fm (requires SETLISTFM_API_KEY)")
-	fmt.Fprintln(w, "  json <file>                Import from canonical JSON")
+	fmt.Fprintln(w, "  json <file>                Import from canonical JSON (.json or .json.gz)")
 	fmt.Fprintln(w, "  lyrics <file>              Import lyrics from JSON")
 	fmt.Fprintln(w, "  aliases <file>             Import song alias mappings")
 	fmt.Fprintln(w, "  relations <file>           Import song-to-song relations (variant_of, merge_into, pairs_with)")
@@ -42,7 +42,7 @@ def fetch_relisten_show(date_str, session):
         if r.status_code == 404:
             return []
         r.raise_for_status()
-        data = r.json()
+        data = json.loads(r.content)  # parse bytes directly; skips charset detection
     except Exception as e:
         print(f"  warn: {date_str}: {e}", file=sys.stderr)
         return []
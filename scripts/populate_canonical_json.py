@@ -1,55 +1,256 @@
 #!/usr/bin/env python3
 """
-Populate a GDQL canonical JSON file from good sources (Relisten API, optional Archive.org).
+Populate a GDQL canonical JSON file from the Relisten API.
 
 Output can be imported with:  gdql import json <output.json>
 
 Usage:
-  pip install requests
+  pip install requests            # optional: orjson for faster JSON parsing/writing
   python scripts/populate_canonical_json.py -o shows.json
   python scripts/populate_canonical_json.py -o shows.json --years 1972 1977 1978
   python scripts/populate_canonical_json.py -o shows.json --first-year 1965 --last-year 1995
+  python scripts/populate_canonical_json.py -o shows.json.gz     # gzip-compressed output
 """
 
 import argparse
+import gzip
+import hashlib
 import json
+import os
 import re
 import sys
+import tempfile
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from urllib.parse import quote
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 except ImportError:
     print("pip install requests", file=sys.stderr)
     sys.exit(1)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Relisten: https://api.relisten.net or https://relistenapi.alecgorge.com (see RelistenNet/RelistenApi on GitHub)
 RELISTEN_BASE = "https://api.relisten.net/api/v2"
 ARTIST_SLUG = "grateful-dead"
 
+_SEGUE_RE = re.compile(r"\s*-?>\s*")
+_DATE_RE = re.compile(r"(\d{4})-?(\d{2})-?(\d{2})")
+
+
+def loads(data):
+    """Parse JSON from bytes, via orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class RateLimiter:
+    """Spaces requests at least min_interval seconds apart across all threads.
+
+    Time already spent waiting on a slow response counts toward the spacing,
+    so callers only sleep for whatever is left of the interval.
+    """
+
+    def __init__(self, min_interval):
+        self.min_interval = max(0.0, min_interval)
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ResponseCache:
+    """On-disk store of JSON responses, one file per URL under a cache directory.
+
+    Each file is a JSON object with etag, last_modified, fetched_at and the
+    UTF-8 response body; get() returns it as an
+    (etag, last_modified, body, fetched_at) tuple. Entries younger than ttl
+    seconds are served without a request; older ones are revalidated with a
+    conditional GET.
+    """
+
+    def __init__(self, path, ttl=0):
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, url):
+        return os.path.join(self.path, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url):
+        try:
+            with open(self._file(url), encoding="utf-8") as f:
+                e = json.load(f)
+            return (e["etag"], e["last_modified"], e["body"].encode("utf-8"), float(e["fetched_at"]))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def put(self, url, etag, last_modified, body):
+        try:
+            text = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return  # only UTF-8 bodies are cached
+        entry = {"etag": etag, "last_modified": last_modified, "fetched_at": time.time(), "body": text}
+        # Write to a uniquely named temp file, then rename, so concurrent
+        # writers (threads or other runs sharing the directory) never clash
+        # and readers never see a partial entry
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.path, suffix=".tmp", delete=False) as f:
+            try:
+                json.dump(entry, f, ensure_ascii=False)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, self._file(url))
+
+    def is_fresh(self, entry):
+        return time.time() - entry[3] < self.ttl
+
+
+def get_json(session, url, cache=None, limiter=None, timeout=30):
+    """GET url and parse JSON.
+
+    With a cache, fresh entries skip the network entirely and stale ones are
+    revalidated via ETag/Last-Modified, reusing the body on 304. The limiter
+    is only consulted when a request is actually sent.
+    """
+    entry = cache.get(url) if cache is not None else None
+    if entry and cache.is_fresh(entry):
+        return loads(entry[2])
+    headers = {}
+    if entry:
+        etag, last_modified, _, _ = entry
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    if limiter:
+        limiter.acquire()
+    r = session.get(url, headers=headers, timeout=timeout)
+    if r.status_code == 304 and entry:
+        cache.put(url, entry[0], entry[1], entry[2])
+        return loads(entry[2])
+    r.raise_for_status()
+    if cache is not None:
+        cache.put(url, r.headers.get("ETag"), r.headers.get("Last-Modified"), r.content)
+    return loads(r.content)
+
 
 def parse_segue_titles(track_title):
     """Split 'Scarlet Begonias > Fire on the Mountain' into [('Scarlet Begonias', False), ('Fire on the Mountain', True)]."""
-    parts = re.split(r"\s*-?>\s*", track_title.strip())
+    track_title = track_title.strip()
+    if ">" not in track_title:
+        return [(track_title, False)]
+    parts = _SEGUE_RE.split(track_title)
     out = []
     for i, name in enumerate(parts):
         name = name.strip()
         if name:
             out.append((name, i > 0))  # segue_before true for all but first
-    return out if out else [(track_title.strip(), False)]
+    return out if out else [(track_title, False)]
 
 
 def normalize_date(s):
-    """Return YYYY-MM-DD from API date (e.g. 1977-05-08T00:00:00Z or 1977-05-08)."""
+    """Return YYYY-MM-DD from API date (e.g. 1977-05-08T00:00:00Z, 1977-05-08 or 19770508)."""
     s = (s or "").strip()
-    if len(s) >= 10 and s[4] == "-" and s[7] == "-":
-        return s[:10]
+    m = _DATE_RE.match(s)
+    if m:
+        return f"{m[1]}-{m[2]}-{m[3]}"
     return s
 
 
-def relisten_show_to_canonical(show):
-    """Convert one Relisten show payload to canonical Show dict."""
+def _venue_to_canonical(venue):
+    name = (venue.get("name") or "").strip() or "Unknown"
+    location = (venue.get("location") or "").strip()
+    city = (venue.get("city") or "").strip()
+    state = (venue.get("state") or "").strip()
+    country = (venue.get("country") or "").strip()
+    if not city and location:
+        city = location  # Relisten uses "location" e.g. "Van Nuys, CA"
+    # Venue fields repeat across hundreds of shows; share one string per value
+    return {"name": sys.intern(name), "city": sys.intern(city), "state": sys.intern(state), "country": sys.intern(country)}
+
+
+def _append_track_songs(songs, title, duration):
+    """Append the song(s) for one track title, splitting segues and their duration."""
+    parsed = parse_segue_titles(title)
+    # Split duration evenly across segued songs in a combined track
+    per_song = duration // len(parsed) if duration > 0 and len(parsed) > 0 else 0
+    for name, segue_before in parsed:
+        song = {"name": name, "segue_before": segue_before}
+        if per_song > 0:
+            song["length_seconds"] = per_song
+        songs.append(song)
+
+
+def _show_to_canonical(show, date, v, sets_out):
+    if not sets_out:
+        return None
+
+    tour = (show.get("tour") or {}).get("name", "") if isinstance(show.get("tour"), dict) else (show.get("tour") or "")
+    if isinstance(tour, str):
+        tour = sys.intern(tour)
+
+    return {
+        "date": date,
+        "venue": v,
+        "tour": tour,
+        "notes": show.get("notes") or "",
+        "sets": sets_out,
+        # Dedupe key for write_shows; removed before the show is serialized
+        "_dedup_key": (date, v["name"], v["city"]),
+    }
+
+
+def _canonical_fast(show):
+    """Convert a show in Relisten's usual shape: venue dict, sources[0].sets[].tracks[].title.
+
+    Raises (KeyError, TypeError, AttributeError, IndexError) on anything else.
+    """
+    date_str = show["date"]
+    if not date_str:
+        raise KeyError("date")
+    v = _venue_to_canonical(show["venue"])
+
+    sets_out = []
+    # Relisten returns many sources (recordings) per show; use first source for one setlist
+    raw_sets = show["sources"][0]["sets"]
+    if not raw_sets:
+        raise KeyError("sets")
+    for s in raw_sets:
+        tracks = s["tracks"]
+        if not tracks:
+            raise KeyError("tracks")
+        songs = []
+        for t in tracks:
+            title = t["title"].strip()
+            if not title:
+                raise KeyError("title")
+            _append_track_songs(songs, title, int(t.get("duration") or 0))
+        sets_out.append({"songs": songs})
+
+    return _show_to_canonical(show, normalize_date(date_str), v, sets_out)
+
+
+def _canonical_slow(show):
+    """Convert a show in any of the payload shapes seen across Relisten-like APIs."""
     date_str = show.get("date") or show.get("display_date") or ""
     if not date_str:
         return None
@@ -57,14 +258,7 @@ def relisten_show_to_canonical(show):
 
     venue = show.get("venue") or {}
     if isinstance(venue, dict):
-        name = (venue.get("name") or "").strip() or "Unknown"
-        location = (venue.get("location") or "").strip()
-        city = (venue.get("city") or "").strip()
-        state = (venue.get("state") or "").strip()
-        country = (venue.get("country") or "").strip()
-        if not city and location:
-            city = location  # Relisten uses "location" e.g. "Van Nuys, CA"
-        v = {"name": name, "city": city, "state": state, "country": country}
+        v = _venue_to_canonical(venue)
     else:
         v = {"name": "Unknown", "city": "", "state": "", "country": ""}
 
@@ -98,125 +292,161 @@ def relisten_show_to_canonical(show):
                 if not title:
                     continue
                 duration = int(t.get("duration") or 0) if isinstance(t, dict) else 0
-                parsed = parse_segue_titles(title)
-                # Split duration evenly across segued songs in a combined track
-                per_song = duration // len(parsed) if duration > 0 and len(parsed) > 0 else 0
-                for name, segue_before in parsed:
-                    song = {"name": name, "segue_before": segue_before}
-                    if per_song > 0:
-                        song["length_seconds"] = per_song
-                    songs.append(song)
+                _append_track_songs(songs, title, duration)
             if songs:
                 sets_out.append({"songs": songs})
 
-    if not sets_out:
-        return None
+    return _show_to_canonical(show, date, v, sets_out)
 
-    return {
-        "date": date,
-        "venue": v,
-        "tour": (show.get("tour") or {}).get("name", "") if isinstance(show.get("tour"), dict) else (show.get("tour") or ""),
-        "notes": show.get("notes") or "",
-        "sets": sets_out,
-    }
 
+def relisten_show_to_canonical(show):
+    """Convert one Relisten show payload to canonical Show dict.
+
+    Tries the fast path for Relisten's usual schema and falls back to the
+    defensive converter for any other shape.
+    """
+    try:
+        return _canonical_fast(show)
+    except (KeyError, TypeError, AttributeError, IndexError):
+        return _canonical_slow(show)
+
+
+def fetch_relisten_years(years, session, pool, limiter=None, cache=None):
+    """Fetch all shows for the given years from Relisten on pool.
 
-def fetch_relisten_years(years, session, delay=0.3):
-    """Fetch all shows for the given years from Relisten."""
+    Yields year-list shows as each year arrives, so detail fetches can start
+    before the remaining years are in.
+    """
     base_url = f"{RELISTEN_BASE}/artists/{ARTIST_SLUG}"
-    all_shows = []
-    for year in years:
-        time.sleep(delay)
+
+    def fetch_year(year):
         url = f"{base_url}/years/{year}"
         try:
-            r = session.get(url, timeout=30)
-            r.raise_for_status()
-            data = r.json()
+            data = get_json(session, url, cache, limiter)
         except Exception as e:
             print(f"Warning: Relisten years/{year}: {e}", file=sys.stderr)
-            continue
+            return None
         # Response may be { "shows": [ ... ] } or direct list
-        shows = data.get("shows") or data.get("data") or (data if isinstance(data, list) else [])
-        for s in shows:
-            all_shows.append(s)
-        print(f"Relisten {year}: {len(shows)} shows", file=sys.stderr)
-    return all_shows
-
+        if isinstance(data, list):
+            return data
+        return data.get("shows") or data.get("data") or []
 
-def fetch_relisten_show_details(show_list, session, delay=0.2):
-    """Fetch full show details (with sources/sets) for each show date."""
-    base_url = f"{RELISTEN_BASE}/artists/{ARTIST_SLUG}/shows"
-    out = []
-    for i, show in enumerate(show_list):
-        date_str = show.get("date") or show.get("display_date") or show.get("id")
-        if not date_str:
-            canonical = relisten_show_to_canonical(show)
-            if canonical:
-                out.append(canonical)
+    # Keyed by date+venue so a show listed twice is only fetched once
+    seen = set()
+    for year, shows in zip(years, pool.map(fetch_year, years)):
+        if shows is None:
             continue
-        date_for_url = normalize_date(date_str)
-        time.sleep(delay)
-        url = f"{base_url}/{date_for_url}"
-        try:
-            r = session.get(url, timeout=30)
-            r.raise_for_status()
-            detail = r.json()
-            # Response may be { "show": { ... } } or the show object directly
-            if isinstance(detail, dict) and "show" in detail:
-                detail = detail["show"]
-            canonical = relisten_show_to_canonical(detail)
-            if canonical:
-                out.append(canonical)
-        except Exception:
-            # If year list already had full data, use it
+        print(f"Relisten {year}: {len(shows)} shows", file=sys.stderr)
+        for s in shows:
+            venue = s.get("venue") if isinstance(s.get("venue"), dict) else {}
+            key = (
+                s.get("date") or s.get("display_date") or s.get("id"),
+                venue.get("name"),
+                venue.get("city") or venue.get("location"),
+            )
+            if key not in seen:
+                seen.add(key)
+                yield s
+
+
+def fetch_relisten_show_details(shows, session, pool, limiter=None, cache=None, max_pending=16):
+    """Fetch full show details (with sources/sets) for each show date on pool.
+
+    shows may be any iterable (e.g. fetch_relisten_years). At most max_pending
+    fetches are queued at a time. Yields canonical shows in input order.
+    """
+    base_url = f"{RELISTEN_BASE}/artists/{ARTIST_SLUG}/shows"
+
+    def fetch_one(show):
+        # Year listings sometimes carry the setlist inline; no need to ask again
+        inline = show.get("sources") or show.get("sets")
+        if inline:
             canonical = relisten_show_to_canonical(show)
             if canonical:
-                out.append(canonical)
+                return canonical
+        date_str = show.get("date") or show.get("display_date") or show.get("id")
+        if date_str:
+            date_for_url = normalize_date(date_str)
+            url = f"{base_url}/{date_for_url}"
+            try:
+                detail = get_json(session, url, cache, limiter)
+                # Response may be { "show": { ... } } or the show object directly
+                if isinstance(detail, dict) and "show" in detail:
+                    detail = detail["show"]
+                canonical = relisten_show_to_canonical(detail)
+                if canonical:
+                    return canonical
+            except Exception:
+                pass
+        # Fall back to the year-list entry, unless it was already tried above
+        return None if inline else relisten_show_to_canonical(show)
+
+    def results():
+        # A bounded queue keeps shows (and the year listings they came from)
+        # from piling up in pending work, and means an aborted run only waits
+        # on the few fetches already queued
+        pending = deque()
+        for show in shows:
+            pending.append(pool.submit(fetch_one, show))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    for i, canonical in enumerate(results()):
+        if canonical:
+            yield canonical
         if (i + 1) % 50 == 0:
-            print(f"  fetched {i + 1}/{len(show_list)} shows", file=sys.stderr)
-    return out
+            print(f"  fetched {i + 1} shows", file=sys.stderr)
 
 
-def fetch_archive_etree(year, session, delay=0.5, max_items=200):
-    """Fetch Grateful Dead items from Archive.org etree for a year. Best-effort setlist from metadata."""
-    # advancedsearch: collection:etree and creator:"Grateful Dead" and date
-    q = f"collection:etree AND creator:Grateful Dead AND date:{year}"
-    url = "https://archive.org/advancedsearch.php"
-    params = {"q": q, "fl": ["identifier", "date", "venue", "title"], "output": "json", "rows": max_items, "page": 1}
-    time.sleep(delay)
-    try:
-        r = session.get(url, params=params, timeout=30)
-        r.raise_for_status()
-        data = r.json()
-    except Exception as e:
-        print(f"Warning: Archive.org search {year}: {e}", file=sys.stderr)
-        return []
-    docs = (data.get("response") or {}).get("docs") or []
-    out = []
-    for doc in docs:
-        date_str = (doc.get("date") or "").strip()
-        if not date_str or len(date_str) < 8:
+def dump_show(show):
+    """Serialize one canonical show as a single line of JSON."""
+    if orjson is not None:
+        return orjson.dumps(show).decode("utf-8")
+    return json.dumps(show, ensure_ascii=False, separators=(",", ":"))
+
+
+def open_output(path, compress=False):
+    """Open the output file for writing text, gzip-compressed if compress is set."""
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+    return open(path, "w", encoding="utf-8")
+
+
+def write_shows(f, shows, seen):
+    """Append shows to an open JSON array, skipping any date+venue already in seen."""
+    for c in shows:
+        key = c.pop("_dedup_key")
+        if key in seen:
             continue
-        # Normalize YYYYMMDD or YYYY-MM-DD
-        if len(date_str) == 8 and date_str.isdigit():
-            date_str = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
-        venue_name = (doc.get("venue") or doc.get("title") or "Unknown").strip()
-        if isinstance(venue_name, list):
-            venue_name = (venue_name[0] or "Unknown").strip()
-        # Archive often doesn't give us track list in search; we'd need item metadata. Skip or add one placeholder set.
-        # So we only add a stub show if we want to merge with Relisten later; for now skip archive if no tracks.
-        # Option: fetch item metadata for identifier to get tracklist - would need extra request per item.
-    return out
+        f.write(",\n  " if seen else "\n  ")
+        f.write(dump_show(c))
+        seen.add(key)
+
+
+def positive_int(value):
+    """argparse type for options that need a count of at least 1."""
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return n
 
 
 def main():
-    ap = argparse.ArgumentParser(description="Populate GDQL canonical JSON from Relisten (and optional Archive.org)")
-    ap.add_argument("-o", "--output", default="shows.json", help="Output JSON file")
+    ap = argparse.ArgumentParser(description="Populate GDQL canonical JSON from Relisten")
+    ap.add_argument("-o", "--output", default="shows.json", help="Output JSON file (.gz to compress)")
     ap.add_argument("--years", type=int, nargs="+", help="Specific years (e.g. 1972 1977 1978)")
     ap.add_argument("--first-year", type=int, default=1965, help="First year (with --last-year)")
     ap.add_argument("--last-year", type=int, default=1995, help="Last year")
-    ap.add_argument("--relisten-only", action="store_true", help="Only use Relisten API")
-    ap.add_argument("--delay", type=float, default=0.25, help="Delay between API requests (seconds)")
+    ap.add_argument("--delay", type=float, default=0.25, help="Minimum spacing between API requests (seconds)")
+    ap.add_argument("--workers", type=positive_int, default=8, help="Concurrent API requests")
+    ap.add_argument("--cache", default=".relisten_cache", help="Response cache directory")
+    ap.add_argument("--cache-ttl", type=float, default=168, help="Hours to reuse cached responses before revalidating (0 = always revalidate)")
+    ap.add_argument("--no-cache", action="store_true", help="Disable the response cache")
     args = ap.parse_args()
 
     if args.years:
@@ -225,37 +455,49 @@ def main():
         years = list(range(args.first_year, args.last_year + 1))
 
     session = requests.Session()
+    # One pooled keep-alive connection per worker so concurrent fetches don't
+    # evict each other; transient errors and 429s are retried with backoff
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=args.workers, pool_maxsize=args.workers, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
     session.headers.setdefault("User-Agent", "GDQL-populate/1.0 (https://github.com/gdql/gdql)")
 
-    print("Fetching from Relisten API...", file=sys.stderr)
-    show_list = fetch_relisten_years(years, session, delay=args.delay)
-    if not show_list:
-        print("No shows from Relisten. Check API or try --years 1977", file=sys.stderr)
-        sys.exit(1)
-
-    print("Fetching show details (setlists)...", file=sys.stderr)
-    canonical_list = fetch_relisten_show_details(show_list, session, delay=args.delay)
-    if not canonical_list:
-        # Fallback: use year list as-is (sometimes it has sets inline)
-        for s in show_list:
-            c = relisten_show_to_canonical(s)
-            if c:
-                canonical_list.append(c)
-
-    # Dedupe by date+venue
-    seen = set()
-    unique = []
-    for c in canonical_list:
-        key = (c["date"], c["venue"].get("name", ""), c["venue"].get("city", ""))
-        if key in seen:
-            continue
-        seen.add(key)
-        unique.append(c)
-
-    with open(args.output, "w", encoding="utf-8") as f:
-        json.dump(unique, f, indent=2, ensure_ascii=False)
-
-    print(f"Wrote {len(unique)} shows to {args.output}", file=sys.stderr)
+    limiter = RateLimiter(args.delay)
+    cache = None if args.no_cache else ResponseCache(args.cache, ttl=args.cache_ttl * 3600)
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        print("Fetching from Relisten API...", file=sys.stderr)
+        year_shows = fetch_relisten_years(years, session, pool, limiter=limiter, cache=cache)
+        first = next(year_shows, None)
+        if first is None:
+            print("No shows from Relisten. Check API or try --years 1977", file=sys.stderr)
+            sys.exit(1)
+
+        print("Fetching show details (setlists)...", file=sys.stderr)
+        # Shows are written as they arrive; only the dedupe keys stay in memory.
+        # Stream into a temp file so an interrupted run leaves any existing output intact.
+        seen = set()
+        tmp_path = args.output + ".tmp"
+        try:
+            with open_output(tmp_path, compress=args.output.endswith(".gz")) as f:
+                f.write("[")
+                write_shows(f, fetch_relisten_show_details(
+                    chain([first], year_shows), session, pool, limiter=limiter, cache=cache,
+                    max_pending=args.workers * 2,
+                ), seen)
+                f.write("\n]\n")
+            os.replace(tmp_path, args.output)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    except BaseException:
+        # Cancel queued fetches rather than running them all before exiting
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+    print(f"Wrote {len(seen)} shows to {args.output}", file=sys.stderr)
     print(f"Import with: gdql import json {args.output}", file=sys.stderr)
 
 